@@ -1,6 +1,35 @@
+import os
+
 import numpy as np
 from collections import OrderedDict
 
+try:
+    import numba
+    from numba import njit
+    have_numba = not numba.config.DISABLE_JIT
+except ImportError:
+    # numba is optional; without it the decorated functions run as Python
+    have_numba = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# every binary feature a person can have, in the order they are listed
+FEATURES = ['male', 'female',
+            'black', 'white', 'hispanic', 'asian',
+            'prison', 'no_prison',
+            'childcare', 'no_childcare',
+            'highschool', 'no_highschool']
+FEATURE_BIT = OrderedDict((f, 1 << i) for i, f in enumerate(FEATURES))
+
+def decode_features(bits):
+    return [f for f, bit in FEATURE_BIT.items() if bits & bit]
+
+def feature_vectors(bits):
+    # convert an array of bitmasks into a [person, feature] array of 0s and 1s
+    return (bits[:, None] >> np.arange(len(FEATURES))) & 1
+
 class Society:
     neighbourhood_rows = 2
     neighbourhood_cols = 2
@@ -9,10 +38,20 @@ class Society:
     childcare_cost = 4000
     transportation_cost = 2000
 
-    def __init__(self, rng):
+    # numerical attributes of people, as created by create_attributes_batch
+    person_attributes = ['prob_apply', 'distance_penalty',
+                         'interview_skill', 'interview_skill_sd',
+                         'experience', 'experience_service',
+                         'experience_manufacturing', 'unemployed_time']
+    # the numerical values that job suitability can depend on
+    attribute_names = person_attributes + ['age']
+
+    def __init__(self, rng, years_per_step=0.1, max_age=25):
         self.rng = rng
         self.gender = OrderedDict(male=0.5, female=0.5)
         self.race = OrderedDict(black=0.3, white=0.3, hispanic=0.2, asian=0.2)
+        self.gender_bits, self.gender_probs = self.encode_options(self.gender)
+        self.race_bits, self.race_probs = self.encode_options(self.race)
 
         self.interv_private = 0
         self.interv_public = 0
@@ -47,6 +86,7 @@ class Society:
             }
         self.job_commonality = OrderedDict(service_low=0.3, service_high=0.3,
                                            manufacturing_low=0.2, manufacturing_high=0.2)
+        self.job_types = list(self.job_commonality.keys())
         self.job_income = {
             'service_low': (13000, 1300),   # starting, annual raise
             'service_high': (22000, 3600),   # starting, annual raise
@@ -73,55 +113,147 @@ class Society:
             'manufacturing_high': 5000,
         }
 
-        self.neighbourhoods = [Neighbourhood(self)
+        self.neighbourhoods = [Neighbourhood(self, i)
                                for i in range(self.neighbourhood_count)]
         self.distance_penalty_scale = 10000
         self.set_racial_discrimination(0.3)
+        self.build_conditional_tables()
+        self.build_income_tables(years_per_step, max_age)
+        self.build_retention_table()
 
     def set_racial_discrimination(self, value=1.0,
                                   races=['black', 'hispanic', 'asian']):
         for v in self.jobs.values():
             for r in races:
                 v[r] = -value
+        self.build_job_tables()
+
+    def build_job_tables(self):
+        # dense versions of self.jobs: a bitmask of features that rule a
+        # person out, plus weights for the baseline, each feature and each
+        # numerical attribute, with one row per job type.  This must be
+        # called again whenever self.jobs is changed.
+        n_types = len(self.job_types)
+        self.job_forbidden_mask = np.zeros(n_types, dtype=np.uint32)
+        self.job_baseline = np.zeros(n_types)
+        self.job_weight_matrix = np.zeros((n_types, len(FEATURES)))
+        self.job_attribute_matrix = np.zeros((n_types,
+                                              len(self.attribute_names)))
+        for i, type in enumerate(self.job_types):
+            for feature, value in self.jobs[type].items():
+                if feature in FEATURE_BIT:
+                    if value is None:
+                        self.job_forbidden_mask[i] |= FEATURE_BIT[feature]
+                    else:
+                        j = FEATURES.index(feature)
+                        self.job_weight_matrix[i, j] += value
+                elif feature == 'baseline':
+                    self.job_baseline[i] += value
+                elif feature in self.attribute_names:
+                    j = self.attribute_names.index(feature)
+                    self.job_attribute_matrix[i, j] += value
+
+    def compute_suitability(self, features_bits, attributes):
+        # the suitability of each person for each job type, given their
+        # features and a [person, attribute] array of self.attribute_names
+        score = (self.job_baseline[None, :] +
+                 feature_vectors(features_bits).dot(self.job_weight_matrix.T) +
+                 attributes.dot(self.job_attribute_matrix.T))
+        forbidden = features_bits[:, None] & self.job_forbidden_mask[None, :]
+        score[forbidden != 0] = -np.inf
+        return score
+
+    def build_income_tables(self, dt, max_time):
+        # per job type arrays of the salary, hiring and sector information,
+        # and the productivity for every multiple of dt years of experience
+        types = self.job_types
+        self.job_start_salary = np.array([self.job_income[t][0] for t in types])
+        self.job_raise = np.array([self.job_income[t][1] for t in types])
+        self.job_hiring_cost = np.array([self.job_hiring[t] for t in types],
+                                        dtype=float)
+        self.job_sectors = np.array([self.job_sector[t] for t in types])
+
+        prod_max, prod_time = np.array([self.job_productivity[t]
+                                        for t in types]).T
+        t = np.arange(0, max_time + dt, dt)
+        self.productivity_dt = dt
+        self.productivity_table = prod_max[:, None] * (
+                                1 - np.exp(-t[None, :] / prod_time[:, None]))
+
+    def compute_productivity(self, types, experience):
+        index = np.round(experience / self.productivity_dt).astype(int)
+        index = np.minimum(index, self.productivity_table.shape[1] - 1)
+        return self.productivity_table[types, index]
+
     def adjust_retention(self, value):
         for v in self.job_retention.values():
             for i in range(len(v)):
                 v[i] = 0.5 * (v[i] + value)
+        self.build_retention_table()
 
+    def build_retention_table(self):
+        # job_retention as a [job type, year] array, with the last year
+        # repeated for job types that list fewer years
+        years = max([len(v) for v in self.job_retention.values()])
+        table = []
+        for t in self.job_types:
+            v = self.job_retention[t]
+            table.append(v + [v[-1]] * (years - len(v)))
+        self.retention_table = np.array(table)
 
 
 
-    # numerical
-    def create_attributes(self):
 
+    def build_conditional_tables(self):
+        # p(F|features) can only depend on gender, race, and the binary
+        # features above F in self.probs, so tabulate it for every
+        # combination of those.  The table for the first feature is indexed
+        # by gender * len(race) + race, and each later table by
+        # 2 * (index into the previous table) + (1 if it had that feature).
+        prefixes = [int(g | r) for g in self.gender_bits for r in self.race_bits]
+        self.conditional_tables = []
+        for feature, prob in self.probs:
+            self.conditional_tables.append(np.array([
+                self.compute_conditional(decode_features(bits), prob)
+                for bits in prefixes]))
+            prefixes = [bits | FEATURE_BIT[f] for bits in prefixes
+                        for f in ('no_' + feature, feature)]
+
+    # numerical
+    def create_attributes_batch(self, n):
         attr = {}
-        attr['prob_apply'] = self.rng.normal(0.5, 0.25)
-        attr['distance_penalty'] = self.rng.uniform(0, 0.5)
-        attr['distance_penalty'] = self.rng.uniform(1.0, 2.0)
-        attr['interview_skill'] = self.rng.normal(0.2, 0.2)
-        attr['interview_skill_sd'] = self.rng.uniform(0.1, 0.4)
-        attr['experience'] = 0.0
-        attr['experience_service'] = 0.0
-        attr['experience_manufacturing'] = 0.0
-        attr['unemployed_time'] = 0.0
+        attr['prob_apply'] = self.rng.normal(0.5, 0.25, size=n)
+        attr['distance_penalty'] = self.rng.uniform(1.0, 2.0, size=n)
+        attr['interview_skill'] = self.rng.normal(0.2, 0.2, size=n)
+        attr['interview_skill_sd'] = self.rng.uniform(0.1, 0.4, size=n)
+        attr['experience'] = np.zeros(n)
+        attr['experience_service'] = np.zeros(n)
+        attr['experience_manufacturing'] = np.zeros(n)
+        attr['unemployed_time'] = np.zeros(n)
         return attr
 
-    # binary
-    def create_features(self):
-        features = []
-        features.append(self.pick_one(self.gender))
-        features.append(self.pick_one(self.race))
-        for feature, prob in self.probs:
-            p = self.compute_conditional(features, prob)
-            if self.rng.rand() < p:
-                features.append(feature)
-            else:
-                features.append('no_' + feature)
-        return features
-
-    def pick_one(self, options):
+    # binary, returned as a bitmask of FEATURE_BIT values per person
+    def create_features_batch(self, n):
+        gender = self.pick_batch(self.gender_probs, n)
+        race = self.pick_batch(self.race_probs, n)
+        bits = self.gender_bits[gender] | self.race_bits[race]
+        index = gender * len(self.race_probs) + race
+        for k, (feature, prob) in enumerate(self.probs):
+            has = self.rng.random(n) < self.conditional_tables[k][index]
+            bits |= np.where(has, FEATURE_BIT[feature],
+                             FEATURE_BIT['no_' + feature]).astype(np.uint32)
+            index = 2 * index + has
+        return bits
+
+    def encode_options(self, options):
+        # the FEATURE_BIT and probability of each of a set of exclusive options
         assert isinstance(options, OrderedDict)
-        return self.rng.choice(options.keys(), p=options.values())
+        bits = np.array([FEATURE_BIT[k] for k in options.keys()],
+                        dtype=np.uint32)
+        return bits, np.array(list(options.values()))
+
+    def pick_batch(self, probs, n):
+        return self.rng.choice(len(probs), size=n, p=probs)
 
     def compute_conditional(self, feature, prob):
         # given the set of conditional probabilities and the given features,
@@ -145,68 +277,95 @@ class Society:
             return pF
         p = [prob[k] for k in relevant]
         if len(p) == 1:
-            return p
+            return p[0]
         all = np.prod(p)
         none = np.prod([1-pp for pp in p])
         probability = all / (all + (pF / (1-pF)) * none)
         return probability
 
 def color_blend(c1, c2, blend):
-    if blend <= 0:
-        c = c1
-    elif blend >= 1.0:
-        c = c2
-    else:
-        c = c1 * (1-blend) + c2 * (blend)
-    return '#%02x%02x%02x' % (c[0]*255, c[1]*255, c[2]*255)
+    # a (len(blend), 3) uint8 table of colours blended from c1 to c2
+    blend = np.clip(blend, 0, 1.0)[:, None]
+    c = c1 * (1-blend) + c2 * (blend)
+    return (c * 255).astype(np.uint8)
+
+def color_hex(table):
+    return ['#' + bytes(bytearray(row)).hex() for row in table]
+
+# people are coloured by job_length/5.0, and job_length changes in steps of
+# 0.1 years, so the colours are looked up by round(job_length*10)
+color_steps = 50
+color_blends = np.arange(color_steps + 1) / float(color_steps)
+UNEMPLOYED_RGB = color_blend(np.array([1.0, 0.5, 0.5]),
+                             np.array([1.0, 0.0, 0.0]), color_blends)
+EMPLOYED_RGB = color_blend(np.array([0.5, 0.5, 1.0]),
+                           np.array([0.0, 0.0, 1.0]), color_blends)
+UNEMPLOYED_COLORS = color_hex(UNEMPLOYED_RGB)
+EMPLOYED_COLORS = color_hex(EMPLOYED_RGB)
 
 class Person:
-    def __init__(self, society):
-        self.society = society
-        self.age = 16
-        self.job = None
-        self.job_length = 0.0
-        self.income = 0
-        self.features = society.create_features()
-        self.attributes = society.create_attributes()
-        self.neighbourhood = society.rng.choice(society.neighbourhoods)
-        self.location = self.neighbourhood.allocate_location()
-        self.local_preference_bonus = 1000
-        self.childcare_support = 0
-
-    def does_apply(self, job):
-        salary = self.society.job_income[job.type][0]
-        reservation_wage = 11000
-        if 'childcare' in self.features:
-            reservation_wage += self.society.childcare_cost
-            reservation_wage -= self.childcare_support
-        if self.neighbourhood is not job.employer.neighbourhood:
-            reservation_wage += self.society.transportation_cost
-        if reservation_wage > salary:
-            return False
-
-
-        p = self.attributes['prob_apply']
-        if job.employer.neighbourhood is not self.neighbourhood:
-            p -= self.attributes['distance_penalty'] * self.society.distance_penalty_scale
-        return self.society.rng.rand() < p
-
-    def compute_suitability(self, job):
-        score = 0
-        if self.neighbourhood is job.employer.neighbourhood:
-            score += self.local_preference_bonus
-        else:
-            score -= self.society.transportation_cost
-        score += self.society.job_income[job.type][0]
-        return score
+    # a view onto row index of the people arrays stored on the Model
+
+    def __init__(self, model, index):
+        self.model = model
+        self.society = model.society
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, Person) and self.model is other.model and
+                self.index == other.index)
+    def __ne__(self, other):
+        return not self == other
+    def __hash__(self):
+        return hash(self.index)
+
+    @property
+    def age(self):
+        return self.model.ages[self.index]
+    @property
+    def job(self):
+        index = self.model.job_idx[self.index]
+        return None if index < 0 else self.model.jobs[index]
+    @property
+    def job_length(self):
+        return self.model.job_length[self.index]
+    @property
+    def income(self):
+        return self.model.income[self.index]
+    @property
+    def features_bits(self):
+        return self.model.features_bits[self.index]
+    @property
+    def features(self):
+        return decode_features(self.features_bits)
+    @property
+    def attributes(self):
+        attr = {name: getattr(self.model, name)[self.index]
+                for name in self.society.person_attributes}
+        attr['age'] = self.age
+        return attr
+    @property
+    def neighbourhood(self):
+        return self.society.neighbourhoods[self.model.neighbourhood_idx[self.index]]
+    @property
+    def location(self):
+        return tuple(self.model.location[self.index])
+    @property
+    def childcare_support(self):
+        return self.model.childcare_support[self.index]
+    @childcare_support.setter
+    def childcare_support(self, value):
+        self.model.childcare_support[self.index] = value
+
+    def has_feature(self, feature):
+        return bool(self.features_bits & FEATURE_BIT[feature])
 
     def get_color(self):
-        if self.job is None:
-            return color_blend(np.array([1.0, 0.5, 0.5]), np.array([1.0, 0.0, 0.0]),
-                               self.job_length/5.0)
+        index = min(color_steps, int(round(self.job_length*10)))
+        if self.model.job_idx[self.index] < 0:
+            return UNEMPLOYED_COLORS[index]
         else:
-            return color_blend(np.array([0.5, 0.5, 1.0]), np.array([0.0, 0.0, 1.0]),
-                               self.job_length/5.0)
+            return EMPLOYED_COLORS[index]
 
     def get_info(self):
         text = '<h1>Person:</h1>'
@@ -216,24 +375,52 @@ class Person:
         status = 'employed' if self.job is not None else 'unemployed'
         text +='<br/>%s for %2.1f years' % (status, self.job_length)
         if self.job: text += ' at %s' % self.job.type
-        text +='<br/>experience: %2.1f years (%2.1f service, %2.1f manufacturing)' % (self.attributes['experience'],
-                                                                                      self.attributes['experience_service'],
-                                                                                      self.attributes['experience_manufacturing'])
+        attributes = self.attributes
+        text +='<br/>experience: %2.1f years (%2.1f service, %2.1f manufacturing)' % (attributes['experience'],
+                                                                                      attributes['experience_service'],
+                                                                                      attributes['experience_manufacturing'])
         return text
 
 
 
+def employer_property(name):
+    # read-only access to Model.employer_<name>[self.index]
+    return property(lambda self: getattr(self.model, 'employer_' + name)[self.index])
+
 class Employer:
+    # a view onto row index of the employer arrays stored on the Model
     jobs_per_employer = 10
-    def __init__(self, society):
-        self.society = society
-        self.jobs = [Job(society, self) for i in range(self.jobs_per_employer)]
-        self.neighbourhood = society.rng.choice(society.neighbourhoods[1:])
-        self.location = self.neighbourhood.allocate_location()
-        self.total_hiring_cost = 0
-        self.total_salary = 0
-        self.total_productivity = 0
-        self.total_net = 0
+    accounts = ['hiring_cost', 'salary', 'productivity', 'net',
+                'total_hiring_cost', 'total_salary', 'total_productivity',
+                'total_net']
+    def __init__(self, model, index):
+        self.model = model
+        self.society = model.society
+        self.index = index
+        self.jobs = [job for job in model.jobs if job.employer_index == index]
+
+    hiring_cost = employer_property('hiring_cost')
+    salary = employer_property('salary')
+    productivity = employer_property('productivity')
+    net = employer_property('net')
+    total_hiring_cost = employer_property('total_hiring_cost')
+    total_salary = employer_property('total_salary')
+    total_productivity = employer_property('total_productivity')
+    total_net = employer_property('total_net')
+
+    @property
+    def neighbourhood(self):
+        index = self.model.employer_neighbourhood_idx[self.index]
+        return self.society.neighbourhoods[index]
+    @neighbourhood.setter
+    def neighbourhood(self, neighbourhood):
+        self.model.employer_neighbourhood_idx[self.index] = neighbourhood.index
+    @property
+    def location(self):
+        return tuple(self.model.employer_location[self.index])
+    @location.setter
+    def location(self, location):
+        self.model.employer_location[self.index] = location
 
     def get_color(self):
         return '#888'
@@ -242,297 +429,443 @@ class Employer:
         text += 'net: <strong>$%5.2f</strong>' % self.total_net
         return text
 
-    def step(self, dt):
-        self.hiring_cost = 0
-        self.salary = 0
-        self.productivity = 0
-
-        for j in self.jobs:
-            if j.employee is not None:
-                start, slope = self.society.job_income[j.type]
-                salary = start + j.employee.job_length * slope
-                self.salary += salary * dt
-                j.employee.income += salary * dt
-
-                t = j.employee.attributes['experience_'+self.society.job_sector[j.type]]
-
-                prod_max, prod_time = self.society.job_productivity[j.type]
-                prod = prod_max * (1-np.exp(-t/prod_time))
-                self.productivity += prod * dt
-
-                if j.employee.job_length == 0.0:
-                    self.hiring_cost += self.society.job_hiring[j.type]
-
-            self.net = self.productivity - self.hiring_cost - self.salary
-        self.total_net += self.net
-        self.total_salary += self.salary
-        self.total_productivity += self.productivity
-        self.total_hiring_cost += self.hiring_cost
-
 class Job:
-    def __init__(self, society, employer):
-        self.employee = None
-        self.employer = employer
-        self.society = society
-        self.type = society.rng.choice(society.job_commonality.keys(),
-                                       p=society.job_commonality.values())
+    # a view onto row index of the job arrays stored on the Model
+    def __init__(self, model, index):
+        self.model = model
+        self.society = model.society
+        self.index = index
 
-    def compute_suitability(self, person):
-        total = 0
-        for feature, value in self.society.jobs[self.type].items():
-            if value is None and feature in person.features:
-                return -np.inf
-            if feature == 'baseline':
-                total += value
-            elif feature in person.features:
-                total += value
-            elif feature in person.attributes:
-                total += value * person.attributes[feature]
-        return total
+    @property
+    def type(self):
+        return self.society.job_types[self.model.job_type_idx[self.index]]
+    @property
+    def employer_index(self):
+        return self.model.job_employer_idx[self.index]
+    @property
+    def employer(self):
+        return self.model.employers[self.employer_index]
 
 
 
 
 class Neighbourhood:
-    def __init__(self, society):
+    def __init__(self, society, index):
         self.society = society
+        self.index = index
         self.rows = 7
         self.cols = 7
+        # where this neighbourhood's cells start on the overall grid
+        self.x_offset = (index % society.neighbourhood_cols) * self.cols
+        self.y_offset = (index // society.neighbourhood_cols) * self.rows
         x, y = np.meshgrid(np.arange(self.cols), np.arange(self.rows))
-        self.locations = zip(x.flatten(),y.flatten())
+        self.locations = list(zip(x.flatten(),y.flatten()))
     def allocate_location(self):
         if len(self.locations) == 0:
-            print 'warning: not enough space in neighbourhood'
+            print('warning: not enough space in neighbourhood')
             return (0,0)
-        index = self.society.rng.randint(len(self.locations))
-        return self.locations.pop(index)
+        # swap the chosen location to the end so removing it is O(1)
+        index = self.society.rng.integers(len(self.locations))
+        locs = self.locations
+        locs[index], locs[-1] = locs[-1], locs[index]
+        return locs.pop()
     def free_location(self, loc):
         self.locations.append(loc)
 
 
+@njit(cache=True)
+def match_offers(interview_scores, person_job_score):
+    # interview_scores[job, person] is how well the person did in the
+    # interview for that job (-inf if they did not apply).
+    # person_job_score[person, job] is how much the person wants the job.
+    # Every job offers itself to its best applicant, and every person with
+    # offers accepts the one they like best.  Ties go to the first.
+    n_people, n_jobs = person_job_score.shape
+    person_to_job = np.full(n_people, -1, dtype=np.int64)
+    for j in range(n_jobs):
+        best = -1
+        best_score = -np.inf
+        for a in range(n_people):
+            if interview_scores[j, a] > best_score:
+                best = a
+                best_score = interview_scores[j, a]
+        if best >= 0 and best_score > 0:
+            offer = person_to_job[best]
+            if offer < 0 or (person_job_score[best, j] >
+                             person_job_score[best, offer]):
+                person_to_job[best] = j
+    for p in range(n_people):
+        j = person_to_job[p]
+        if j >= 0 and person_job_score[p, j] <= 0:
+            person_to_job[p] = -1
+    return person_to_job
+
+def match_offers_vectorized(interview_scores, person_job_score):
+    # the same as match_offers, but using whole-array numpy operations,
+    # which is much faster than running its loops as plain Python
+    n_people, n_jobs = person_job_score.shape
+    person_to_job = np.full(n_people, -1, dtype=np.int64)
+    if n_people == 0 or n_jobs == 0:
+        return person_to_job
+    jobs = np.arange(n_jobs)
+    best = np.argmax(interview_scores, axis=1)
+    offered = interview_scores[jobs, best] > 0
+    # offers[person, job] is how much they want each job they were offered
+    offers = np.full((n_people, n_jobs), -np.inf)
+    offers[best[offered], jobs[offered]] = person_job_score[best[offered],
+                                                            jobs[offered]]
+    choice = np.argmax(offers, axis=1)
+    accept = offers[np.arange(n_people), choice] > 0
+    person_to_job[accept] = choice[accept]
+    return person_to_job
+
+if not have_numba:
+    match_offers = match_offers_vectorized
+
+
 class Model:
     employer_count = 10
     people_per_step = 1
     years_per_step = 0.1
     max_age = 25
+    local_preference_bonus = 1000
+    # how many steps of data to make room for at first
+    initial_data_steps = 16
+
+    # every per-person value, each stored as an array on the Model
+    person_arrays = Society.person_attributes + [
+        'ages', 'job_length', 'job_idx', 'income', 'childcare_support',
+        'neighbourhood_idx', 'location', 'features_bits']
 
     def __init__(self, seed=None):
-        self.rng = np.random.RandomState(seed=seed)
-        self.society = Society(self.rng)
-        self.employers = [Employer(self.society)
-                          for i in range(self.employer_count)]
-        self.people = []
+        self.rng = np.random.default_rng(seed)
+        self.society = Society(self.rng, self.years_per_step, self.max_age)
+        self.create_employers()
+        self.init_people()
         self.steps = 0
         self.interventions = []
-        self.data = {}
         self.init_data()
 
+    def create_employers(self):
+        society = self.society
+        n_jobs = self.employer_count * Employer.jobs_per_employer
+        commonality = np.array(list(society.job_commonality.values()))
+        self.job_type_idx = self.rng.choice(len(commonality), size=n_jobs,
+                                            p=commonality)
+        self.job_employer_idx = np.repeat(np.arange(self.employer_count),
+                                          Employer.jobs_per_employer)
+        # employers are never placed in the first neighbourhood
+        self.employer_neighbourhood_idx = 1 + self.rng.integers(
+            len(society.neighbourhoods) - 1, size=self.employer_count)
+        self.employer_location = np.array([
+            society.neighbourhoods[i].allocate_location()
+            for i in self.employer_neighbourhood_idx], dtype=int)
+        for name in Employer.accounts:
+            setattr(self, 'employer_' + name, np.zeros(self.employer_count))
+        self.jobs = [Job(self, i) for i in range(n_jobs)]
+        self.employers = [Employer(self, i) for i in range(self.employer_count)]
+
+    def init_people(self):
+        for name in self.person_arrays:
+            setattr(self, name, np.zeros(0))
+        self.job_idx = np.zeros(0, dtype=int)
+        self.neighbourhood_idx = np.zeros(0, dtype=int)
+        self.location = np.zeros((0, 2), dtype=int)
+        self.features_bits = np.zeros(0, dtype=np.uint32)
+
+    def add_people(self, n):
+        society = self.society
+        bits = society.create_features_batch(n)
+        new = society.create_attributes_batch(n)
+        new['features_bits'] = bits
+        new['ages'] = np.full(n, 16.0)
+        new['job_length'] = np.zeros(n)
+        new['job_idx'] = np.full(n, -1, dtype=int)
+        new['income'] = np.zeros(n)
+        new['childcare_support'] = np.zeros(n)
+        neighbourhood_idx = self.rng.integers(len(society.neighbourhoods),
+                                              size=n)
+        new['neighbourhood_idx'] = neighbourhood_idx
+        new['location'] = np.array([
+            society.neighbourhoods[i].allocate_location()
+            for i in neighbourhood_idx], dtype=int).reshape(n, 2)
+        for name in self.person_arrays:
+            setattr(self, name, np.concatenate([getattr(self, name),
+                                                new[name]]))
+
+    @property
+    def n_people(self):
+        return len(self.ages)
+
+    @property
+    def people(self):
+        return [Person(self, i) for i in range(self.n_people)]
+
     def step(self):
         self.steps += 1
         for interv in self.interventions:
             interv.apply(self, self.steps)
 
-        for i in range(self.people_per_step):
-            self.people.append(Person(self.society))
-
-
-        applications = OrderedDict()
-        for e in self.employers:
-            for j in e.jobs:
-                if j.employee is None:
-                    applications[j] = []
-        for p in self.people:
-            if p.job is None:
-                for j in applications.keys():
-                    if p.does_apply(j):
-                        applications[j].append(p)
-
-        interview = {}
-        for job, applicants in applications.items():
-            for a in applicants:
-                score = job.compute_suitability(a)
-                score += self.rng.normal(a.attributes['interview_skill'],
-                                         a.attributes['interview_skill_sd'])
-                interview[(job, a)] = score
-
+        self.add_people(self.people_per_step)
+
+
+        filled = np.zeros(len(self.jobs), dtype=bool)
+        filled[self.job_idx[self.job_idx >= 0]] = True
+        open_jobs = np.nonzero(~filled)[0]
+        unemployed = np.nonzero(self.job_idx < 0)[0]
+        applies = self.find_applications(unemployed, open_jobs)
+
+        # interview[job, person] for every (open job, unemployed) pair,
+        # -inf where the person did not apply
+        job, person = np.nonzero(applies.T)
+        suitability = self.society.compute_suitability(
+            self.features_bits[unemployed], self.get_attributes(unemployed))
+        interview = np.full((len(open_jobs), len(unemployed)), -np.inf,
+                            dtype=np.float32)
+        interview[job, person] = (
+            suitability[person, self.job_type_idx[open_jobs[job]]] +
+            self.rng.normal(self.interview_skill[unemployed[person]],
+                            self.interview_skill_sd[unemployed[person]]))
+
+        person_job_score = self.compute_person_job_scores(unemployed,
+                                                          open_jobs)
+        person_to_job = match_offers(interview, person_job_score)
+        hired = np.nonzero(person_to_job >= 0)[0]
+        self.job_idx[unemployed[hired]] = open_jobs[person_to_job[hired]]
+        self.job_length[unemployed[hired]] = 0.0
+
+        # matching used to be repeated for 4 rounds.  The scores never
+        # change, so every round made the same hires, but each round charged
+        # the per-job intervention costs again.  The game's cost balance is
+        # tuned with that charge, so it is kept.
         iterations = 4
-        for i in range(iterations):
-            all_offers = OrderedDict()
-            for job, applicants in applications.items():
-
-                score = [interview[(job, a)] for a in applicants]
-
-                if len(score) > 0:
-                    max_score = max(score)
-                    if max_score > 0:
-                        index = score.index(max_score)
-                        person = applicants[index]
-                        if person not in all_offers:
-                            all_offers[person] = []
-                        all_offers[person].append(job)
-
-            for person, offers in all_offers.items():
-                score = [person.compute_suitability(j) for j in offers]
-                if len(score) > 0:
-                    max_score = max(score)
-                    if max_score > 0:
-                        index = score.index(max_score)
-                        job = offers[index]
-
-                        person.job = job
-                        job.employee = person
-                        self.society.interv_public += self.society.get_job_cost_public
-                        self.society.interv_private += self.society.get_job_cost_private
-                        person.job_evaluation = 'medium'
-                        person.job_length = 0.0
+        self.society.interv_public += iterations * len(hired) * self.society.get_job_cost_public
+        self.society.interv_private += iterations * len(hired) * self.society.get_job_cost_private
 
-        for e in self.employers:
-            e.step(self.years_per_step)
+        self._employer_step_vectorized(self.years_per_step)
         self.increase_age()
         self.remove_older()
         self.job_evaluation()
 
         self.update_data()
 
-    def job_evaluation(self):
-        for p in self.people:
-            if p.job is not None:
-                index = int(p.job_length)
-                retention = self.society.job_retention[p.job.type]
-                if index >= len(retention):
-                    r = retention[-1]
-                else:
-                    r = retention[index]
-                r = (1-r) * self.years_per_step
-                if self.society.rng.rand() < r:
-                    self.fire(p)
+    def get_attribute(self, name):
+        # the array holding one of Society.attribute_names for everyone
+        return self.ages if name == 'age' else getattr(self, name)
+
+    def get_attributes(self, people):
+        # a [person, attribute] array of Society.attribute_names
+        return np.column_stack([self.get_attribute(name)[people]
+                                for name in self.society.attribute_names])
+
+    def get_sector_experience(self, people, types):
+        # each person's experience in the sector of the given job type
+        sectors = self.society.job_sectors[types]
+        experience = np.zeros(len(people))
+        for sector in set(self.society.job_sector.values()):
+            match = sectors == sector
+            experience[match] = getattr(self, 'experience_%s' % sector)[people[match]]
+        return experience
+
+    def find_applications(self, people, jobs):
+        # returns a [person, job] boolean array of who applies for what
+        society = self.society
+        salary = society.job_start_salary[self.job_type_idx[jobs]]
+        job_neighbourhood = self.employer_neighbourhood_idx[
+                                                self.job_employer_idx[jobs]]
+        remote = (self.neighbourhood_idx[people][:, None] !=
+                  job_neighbourhood[None, :])
+
+        childcare = (self.features_bits[people] & FEATURE_BIT['childcare']) != 0
+        reservation_wage = 11000 + np.where(childcare,
+                society.childcare_cost - self.childcare_support[people], 0)
+        reservation_wage = (reservation_wage[:, None] +
+                            remote * society.transportation_cost)
+        eligible = reservation_wage <= salary[None, :]
+
+        p = (self.prob_apply[people][:, None] - remote *
+             self.distance_penalty[people][:, None] *
+             society.distance_penalty_scale)
+        applies = np.zeros(eligible.shape, dtype=bool)
+        applies[eligible] = self.rng.random(np.count_nonzero(eligible)) < p[eligible]
+        return applies
+
+    def _employer_step_vectorized(self, dt):
+        # pay every employee and add up the salary, productivity and hiring
+        # costs of each employer
+        society = self.society
+        people = np.nonzero(self.job_idx >= 0)[0]
+        jobs = self.job_idx[people]
+        types = self.job_type_idx[jobs]
+        employer = self.job_employer_idx[jobs]
+        job_length = self.job_length[people]
+
+        salary = (society.job_start_salary[types] +
+                  job_length * society.job_raise[types]) * dt
+        self.income[people] += salary
+        experience = self.get_sector_experience(people, types)
+        productivity = society.compute_productivity(types, experience) * dt
+        hiring_cost = np.where(job_length == 0.0,
+                               society.job_hiring_cost[types], 0.0)
+
+        for name, values in [('salary', salary),
+                             ('productivity', productivity),
+                             ('hiring_cost', hiring_cost)]:
+            total = np.zeros(self.employer_count)
+            np.add.at(total, employer, values)
+            setattr(self, 'employer_' + name, total)
+        self.employer_net = (self.employer_productivity -
+                             self.employer_hiring_cost - self.employer_salary)
+
+        self.employer_total_net += self.employer_net
+        self.employer_total_salary += self.employer_salary
+        self.employer_total_productivity += self.employer_productivity
+        self.employer_total_hiring_cost += self.employer_hiring_cost
+
+    def compute_person_job_scores(self, people, jobs):
+        # how much each person wants each job: its starting salary, plus a
+        # bonus if it is in their neighbourhood or the cost of getting there
+        society = self.society
+        salary = society.job_start_salary[self.job_type_idx[jobs]]
+        job_neighbourhood = self.employer_neighbourhood_idx[
+                                                self.job_employer_idx[jobs]]
+        local = (self.neighbourhood_idx[people][:, None] ==
+                 job_neighbourhood[None, :])
+        return salary[None, :] + np.where(local, self.local_preference_bonus,
+                                          -society.transportation_cost)
 
-    def fire(self, person):
-        assert person.job is not None
-        person.job.employee = None
-        person.job = None
-        person.job_length = 0.0
+    def job_evaluation(self):
+        table = self.society.retention_table
+        people = np.nonzero(self.job_idx >= 0)[0]
+        types = self.job_type_idx[self.job_idx[people]]
+        year = np.minimum(self.job_length[people].astype(int),
+                          table.shape[1] - 1)
+        r = (1 - table[types, year]) * self.years_per_step
+        fired = people[self.rng.random(len(people)) < r]
+        self.job_idx[fired] = -1
+        self.job_length[fired] = 0.0
 
 
 
     def increase_age(self):
-        for p in self.people:
-            p.age += self.years_per_step
-            p.job_length += self.years_per_step
-            if p.job is not None:
-                p.attributes['experience'] += self.years_per_step
-                sector = self.society.job_sector[p.job.type]
-                p.attributes['experience_%s' % sector] += self.years_per_step
-            else:
-                p.attributes['unemployed_time'] += self.years_per_step
-            p.attributes['age'] = p.age
+        dt = self.years_per_step
+        employed = np.nonzero(self.job_idx >= 0)[0]
+        self.ages += dt
+        self.job_length += dt
+        self.experience[employed] += dt
+        self.unemployed_time[self.job_idx < 0] += dt
+
+        sector = self.society.job_sectors[self.job_type_idx[self.job_idx[employed]]]
+        for s in set(self.society.job_sector.values()):
+            getattr(self, 'experience_%s' % s)[employed[sector == s]] += dt
 
     def remove_older(self):
-        for p in self.people:
-            if p.age > self.max_age:
-                p.neighbourhood.free_location(p.location)
-                self.people.remove(p)
-                if p.job is not None:
-                    p.job.employee = None
+        keep = self.ages <= self.max_age
+        if keep.all():
+            return
+        for i in np.nonzero(~keep)[0]:
+            neighbourhood = self.society.neighbourhoods[self.neighbourhood_idx[i]]
+            neighbourhood.free_location(tuple(self.location[i]))
+        self._compact(keep)
+
+    def _compact(self, keep):
+        # drop every person whose entry in keep is False.  Jobs refer to
+        # people only through job_idx, so nothing else needs renumbering.
+        for name in self.person_arrays:
+            setattr(self, name, getattr(self, name)[keep])
 
 
     def calc_employment(self):
-        count = 0
-        for p in self.people:
-            if p.job is not None:
-                count += 1
-        return float(count)/len(self.people)
+        count = np.count_nonzero(self.job_idx >= 0)
+        return float(count)/self.n_people
 
     def calc_feature_employment(self, feature):
-        count = 0
-        total = 0
-        for p in self.people:
-            if feature in p.features:
-                total += 1
-                if p.job is not None:
-                    count += 1
+        has = (self.features_bits & FEATURE_BIT[feature]) != 0
+        total = np.count_nonzero(has)
+        count = np.count_nonzero(has & (self.job_idx >= 0))
         if total == 0: return 0
         return float(count) / total
 
     def calc_attribute_employment(self, attribute, threshold):
-        count = 0
-        total = 0
-        for p in self.people:
-            if p.attributes[attribute] >= threshold:
-                total += 1
-                if p.job is not None:
-                    count += 1
+        has = self.get_attribute(attribute) >= threshold
+        total = np.count_nonzero(has)
+        count = np.count_nonzero(has & (self.job_idx >= 0))
         if total == 0: return 0
         return float(count) / total
 
     def calc_feature_rate(self, feature):
-        count = 0
-        for p in self.people:
-            if feature in p.features:
-                count += 1
-        return float(count)/len(self.people)
+        count = np.count_nonzero(self.features_bits & FEATURE_BIT[feature])
+        return float(count)/self.n_people
 
     def calc_attribute_rate(self, attribute, threshold):
-        count = 0
-        for p in self.people:
-            if p.attributes[attribute] >= threshold:
-                count += 1
-        return float(count)/len(self.people)
+        count = np.count_nonzero(self.get_attribute(attribute) >= threshold)
+        return float(count)/self.n_people
 
     def calc_employer_net(self):
-        return sum([e.net for e in self.employers])
+        return np.sum(self.employer_net)
 
 
     def check_jobs(self):
         for p in self.people:
-            print p.features, p.job.type if p.job is not None else None
+            print(p.features, p.job.type if p.job is not None else None)
         #for e in self.employers:
         #    print e.total_net
 
     def init_data(self):
-        self.data['employment'] = []
-        self.data['employer_net'] = []
-        self.data['highschool'] = []
-        self.data['employment_childcare'] = []
-        self.data['employment_nohighschool'] = []
-        self.data['employment_2_or_more_years'] = []
-        self.data['employment_18plus'] = []
-        self.data['proportion_childcare'] = []
-        self.data['proportion_nohighschool'] = []
-        self.data['proportion_2_or_more_years'] = []
-        self.data['proportion_18plus'] = []
-
-        self.data['cost_hiring'] = []
-        self.data['cost_salary'] = []
-        self.data['production'] = []
-        self.data['interv_public'] = []
-        self.data['interv_private'] = []
+        self.data_keys = ['employment', 'employer_net', 'highschool',
+                          'employment_childcare', 'employment_nohighschool',
+                          'employment_2_or_more_years', 'employment_18plus',
+                          'proportion_childcare', 'proportion_nohighschool',
+                          'proportion_2_or_more_years', 'proportion_18plus',
+
+                          'cost_hiring', 'cost_salary', 'production',
+                          'interv_public', 'interv_private']
 
         #for race in self.society.race.keys():
-        #    self.data['employment_%s' % race] = []
-        #    self.data['proportion_%s' % race] = []
+        #    self.data_keys.append('employment_%s' % race)
+        #    self.data_keys.append('proportion_%s' % race)
+
+        # one row per data key, with a column for each recorded step
+        self._data = np.zeros((len(self.data_keys), self.initial_data_steps))
+        self._data_len = 0
+
+    def __getstate__(self):
+        # only pickle the part of the data buffer that has been filled
+        state = self.__dict__.copy()
+        state['_data'] = self._data[:, :self._data_len]
+        return state
 
     def update_data(self):
         if self.steps >= 100:
-            self.data['employment'].append(self.calc_employment()*100)
-            self.data['employer_net'].append(self.calc_employer_net()*0.001)
-            self.data['highschool'].append(self.calc_feature_rate('highschool')*100)
-            self.data['employment_childcare'].append(self.calc_feature_employment('childcare')*100)
-            self.data['employment_nohighschool'].append(self.calc_feature_employment('no_highschool')*100)
-            self.data['employment_2_or_more_years'].append(self.calc_attribute_employment('experience', threshold=2.0)*100)
-            self.data['employment_18plus'].append(self.calc_attribute_employment('age', threshold=18)*100)
-            self.data['proportion_childcare'].append(self.calc_feature_rate('childcare')*100)
-            self.data['proportion_nohighschool'].append(self.calc_feature_rate('no_highschool')*100)
-            self.data['proportion_2_or_more_years'].append(self.calc_attribute_rate('experience', threshold=2.0)*100)
-            self.data['proportion_18plus'].append(self.calc_attribute_rate('age', threshold=18)*100)
-            self.data['cost_hiring'].append(sum([e.hiring_cost for e in self.employers]))
-            self.data['cost_salary'].append(sum([e.salary for e in self.employers]))
-            self.data['production'].append(sum([e.productivity for e in self.employers]))
-            self.data['interv_public'].append(self.society.interv_public)
-            self.data['interv_private'].append(self.society.interv_private)
+            values = {}
+            values['employment'] = self.calc_employment()*100
+            values['employer_net'] = self.calc_employer_net()*0.001
+            values['highschool'] = self.calc_feature_rate('highschool')*100
+            values['employment_childcare'] = self.calc_feature_employment('childcare')*100
+            values['employment_nohighschool'] = self.calc_feature_employment('no_highschool')*100
+            values['employment_2_or_more_years'] = self.calc_attribute_employment('experience', threshold=2.0)*100
+            values['employment_18plus'] = self.calc_attribute_employment('age', threshold=18)*100
+            values['proportion_childcare'] = self.calc_feature_rate('childcare')*100
+            values['proportion_nohighschool'] = self.calc_feature_rate('no_highschool')*100
+            values['proportion_2_or_more_years'] = self.calc_attribute_rate('experience', threshold=2.0)*100
+            values['proportion_18plus'] = self.calc_attribute_rate('age', threshold=18)*100
+            values['cost_hiring'] = np.sum(self.employer_hiring_cost)
+            values['cost_salary'] = np.sum(self.employer_salary)
+            values['production'] = np.sum(self.employer_productivity)
+            values['interv_public'] = self.society.interv_public
+            values['interv_private'] = self.society.interv_private
             #for race in self.society.race.keys():
-            #    self.data['employment_%s' % race].append(self.calc_feature_employment(race)*100)
-            #    self.data['proportion_%s' % race].append(self.calc_feature_rate(race)*100)
+            #    values['employment_%s' % race] = self.calc_feature_employment(race)*100
+            #    values['proportion_%s' % race] = self.calc_feature_rate(race)*100
+
+            if self._data_len == self._data.shape[1]:
+                # out of room, so double the space available
+                extra = max(self._data_len, self.initial_data_steps)
+                self._data = np.hstack([self._data,
+                                        np.zeros((len(self.data_keys), extra))])
+            self._data[:, self._data_len] = np.array(
+                [values[k] for k in self.data_keys])
+            self._data_len += 1
 
     def get_grid(self):
         grid = []
@@ -550,14 +883,14 @@ class Model:
 
     def get_location(self, item):
         xx, yy = item.location
-        n_index = self.society.neighbourhoods.index(item.neighbourhood)
-        x = (n_index % self.society.neighbourhood_cols) * item.neighbourhood.cols + xx
-        y = (n_index / self.society.neighbourhood_cols) * item.neighbourhood.rows + yy
-        return x, y
+        neighbourhood = item.neighbourhood
+        return int(neighbourhood.x_offset + xx), int(neighbourhood.y_offset + yy)
 
     def get_data(self):
-        self.data['grid'] = self.get_grid()
-        return self.data
+        data = {k: self._data[i, :self._data_len].tolist()
+                for i, k in enumerate(self.data_keys)}
+        data['grid'] = self.get_grid()
+        return data
 
 class RetentionIntervention:
     def __init__(self, time, value):
@@ -613,6 +946,7 @@ class SectorMobilityIntervention:
                     values['employment_manufactoring'] = self.value
                 elif sector == 'manufacturing':
                     values['employment_service'] = self.value
+            model.society.build_job_tables()
             #model.society.get_job_cost_public += self.public_proportion * self.cost_variable
             #model.society.get_job_cost_private += (1 - self.public_proportion) * self.cost_variable
         elif timestep > self.time:
@@ -635,6 +969,7 @@ class PovertyBiasIntervention:
 
             for type, values in model.society.jobs.items():
                 values['unemployed_time'] = self.value
+            model.society.build_job_tables()
             model.society.get_job_cost_public += self.public_proportion * self.cost_variable
             model.society.get_job_cost_private += (1 - self.public_proportion) * self.cost_variable
         elif timestep > self.time:
@@ -657,6 +992,7 @@ class NoHighschoolPenaltyIntervention:
 
             for type, values in model.society.jobs.items():
                 values['no_highschool'] = self.value
+            model.society.build_job_tables()
             model.society.get_job_cost_public += self.public_proportion * self.cost_variable
             model.society.get_job_cost_private += (1 - self.public_proportion) * self.cost_variable
         elif timestep > self.time:
@@ -677,7 +1013,7 @@ class RelocateIntervention:
             model.society.interv_private += (1-self.public_proportion) * self.cost_sunk
 
             for i in range(self.value):
-                employer = model.rng.choice(model.employers)
+                employer = model.employers[model.rng.integers(len(model.employers))]
                 employer.neighbourhood.free_location(employer.location)
                 employer.neighbourhood = model.society.neighbourhoods[0]
                 employer.location = employer.neighbourhood.allocate_location()
@@ -710,25 +1046,25 @@ class ChildcareIntervention:
             model.society.interv_public += self.public_proportion * self.cost_sunk
             model.society.interv_private += (1-self.public_proportion) * self.cost_sunk
 
-            for p in model.people:
-                if 'childcare' in p.features:
-                    if model.rng.rand() < self.proportion:
-                        p.childcare_support = self.value
-                    else:
-                        p.childcare_support = 0
+            people = np.nonzero(model.features_bits & FEATURE_BIT['childcare'])[0]
+            self.give_support(model, people)
         elif timestep > self.time:
             model.society.interv_public += self.public_proportion * self.cost_fixed * Model.years_per_step
             model.society.interv_private += (1-self.public_proportion) * self.cost_fixed * Model.years_per_step
 
-            for p in model.people:
-                if p.age < 16 + Model.years_per_step * 2:
-                    if 'childcare' in p.features:
-                        if model.rng.rand() < self.proportion:
-                            model.society.interv_public += self.public_proportion * self.cost_variable * Model.years_per_step
-                            model.society.interv_private += (1-self.public_proportion) * self.cost_variable * Model.years_per_step
-                            p.childcare_support = self.value
-                        else:
-                            p.childcare_support = 0
+            young = model.ages < 16 + Model.years_per_step * 2
+            childcare = (model.features_bits & FEATURE_BIT['childcare']) != 0
+            people = np.nonzero(young & childcare)[0]
+            supported = self.give_support(model, people)
+            model.society.interv_public += supported * self.public_proportion * self.cost_variable * Model.years_per_step
+            model.society.interv_private += supported * (1-self.public_proportion) * self.cost_variable * Model.years_per_step
+
+    def give_support(self, model, people):
+        # support each of the people with probability self.proportion,
+        # returning how many were supported
+        support = model.rng.random(len(people)) < self.proportion
+        model.childcare_support[people] = np.where(support, self.value, 0)
+        return np.count_nonzero(support)
 
 
 
@@ -746,22 +1082,26 @@ class HighschoolCertificateIntervention:
         if timestep == self.time:
             model.society.interv_public += self.public_proportion * self.cost_sunk
             model.society.interv_private += (1-self.public_proportion) * self.cost_sunk
-            for p in model.people:
-                if 'no_highschool' in p.features:
-                    if model.rng.rand() < self.proportion:
-                        p.features.append('highschool')
-                        p.features.remove('no_highschool')
+            people = np.nonzero(model.features_bits & FEATURE_BIT['no_highschool'])[0]
+            self.certify(model, people)
         elif timestep > self.time:
             model.society.interv_public += self.public_proportion * self.cost_fixed * Model.years_per_step
             model.society.interv_private += (1-self.public_proportion) * self.cost_fixed * Model.years_per_step
-            for p in model.people:
-                if p.age < 16 + Model.years_per_step * 2:
-                    if 'no_highschool' in p.features:
-                        if model.rng.rand() < self.proportion:
-                            model.society.interv_public += self.public_proportion * self.cost_variable
-                            model.society.interv_private += (1-self.public_proportion) * self.cost_variable
-                            p.features.append('highschool')
-                            p.features.remove('no_highschool')
+            young = model.ages < 16 + Model.years_per_step * 2
+            no_highschool = (model.features_bits & FEATURE_BIT['no_highschool']) != 0
+            people = np.nonzero(young & no_highschool)[0]
+            certified = self.certify(model, people)
+            model.society.interv_public += certified * self.public_proportion * self.cost_variable
+            model.society.interv_private += certified * (1-self.public_proportion) * self.cost_variable
+
+    def certify(self, model, people):
+        # give each of the people a highschool certificate with probability
+        # self.proportion, returning how many were given one
+        people = people[model.rng.random(len(people)) < self.proportion]
+        bits = model.features_bits
+        bits[people] &= ~np.uint32(FEATURE_BIT['no_highschool'])
+        bits[people] |= FEATURE_BIT['highschool']
+        return len(people)
 
 def memoize(f):
     """ Memoization decorator for functions taking one or more arguments. """
@@ -780,20 +1120,36 @@ def clear_cache():
     run.clear()  # clear the memoized cache too
 
 
-model_cache = {}
-import copy
+# models are stored pickled, which is much faster than copy.deepcopy for
+# both storing and retrieving them.  The least recently used models are
+# dropped once there are more than model_cache_size of them.
+model_cache = OrderedDict()
+model_cache_size = 200
+import pickle
+
+def cache_model(key, step, model):
+    store_cached_model(key, (step, pickle.dumps(
+                                    model, protocol=pickle.HIGHEST_PROTOCOL)))
+
+def store_cached_model(key, entry):
+    model_cache.pop(key, None)
+    model_cache[key] = entry
+    while len(model_cache) > model_cache_size:
+        model_cache.popitem(last=False)
 
 def find_cached_model(seed, actions):
     for step in reversed(range(len(actions)+1)):
-        result = model_cache.get((seed, tuple(actions[:step])), None)
+        key = (seed, tuple(actions[:step]))
+        result = model_cache.pop(key, None)
         if result is not None:
-            step, model = result
-            return step, copy.deepcopy(model)
+            model_cache[key] = result   # mark as most recently used
+            step, data = result
+            return step, pickle.loads(data)
     model = Model(seed=seed)
     presteps = 100
     for i in range(presteps):
         model.step()
-    model_cache[(seed, ())] = copy.deepcopy(model)
+    cache_model((seed, ()), -1, model)
     return -1, model
 
 @memoize
@@ -867,27 +1223,84 @@ def run(seed, *actions):
                 interv = RelocateIntervention(interv_step, 3, cost_sunk=80000, cost_fixed=0, public_proportion=0.5)
             else:
                 interv = None
-                print 'unknown intervention', action
+                print('unknown intervention', action)
             if interv is not None:
                 model.interventions.append(interv)
             for ii in range(steps_per_action):
                 model.step()
-            model_cache[(seed, tuple(actions[:(i+1)]))] = (i, copy.deepcopy(model))
+            cache_model((seed, tuple(actions[:(i+1)])), i, model)
     return model.get_data()
 
+def run_in_worker(seed, actions):
+    # run one game in a worker process, returning its data along with the
+    # cached models it made so the parent process can reuse them too
+    data = run(seed, *actions)
+    cached = {}
+    for step in range(len(actions)+1):
+        key = (seed, tuple(actions[:step]))
+        if key in model_cache:
+            cached[key] = model_cache[key]
+    return data, cached
+
+def physical_cpu_count():
+    # psutil is optional; without it, fall back to the logical CPU count
+    try:
+        import psutil
+        count = psutil.cpu_count(logical=False)
+    except ImportError:
+        count = None
+    if count is None:
+        count = os.cpu_count()
+    return count
+
+def run_many(jobs, max_workers=None):
+    """Run several games in parallel, one worker process per core.
+
+    jobs is a list of (seed, actions) pairs, and the result is the list of
+    what run(seed, *actions) returns for each of them, in the same order.
+    The results and cached models are merged back into this process.
+    By default there is one worker per physical core; if psutil is not
+    installed this is one per logical CPU instead.
+    """
+    if max_workers is None:
+        max_workers = physical_cpu_count()
+    results = [None] * len(jobs)
+    pending = OrderedDict()
+    for i, (seed, actions) in enumerate(jobs):
+        key = (seed,) + tuple(actions)
+        if key in run:
+            results[i] = run[key]
+        else:
+            pending.setdefault(key, []).append(i)
+
+    if len(pending) > 0:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(key, pool.submit(run_in_worker, key[0], key[1:]))
+                       for key in pending.keys()]
+            for key, future in futures:
+                data, cached = future.result()
+                run[key] = data
+                for k, entry in cached.items():
+                    store_cached_model(k, entry)
+                for i in pending[key]:
+                    results[i] = data
+    return results
+
+
 
 
 
 
 
 if __name__ == '__main__':
-    print 1
+    print(1)
     run(1, 'init')
-    print 2
+    print(2)
     clear_cache()
-    print 3
+    print(3)
     run(1, 'init')
-    print 4
+    print(4)
 
     1/0
 
@@ -899,7 +1312,7 @@ if __name__ == '__main__':
     m.step()
 
     for i in range(1000):
-        print i, len(m.people), m.calc_employment()
+        print(i, len(m.people), m.calc_employment())
         m.check_jobs()
         m.step()
 